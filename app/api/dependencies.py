@@ -0,0 +1,18 @@
+from fastapi import HTTPException
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def get_translator():
+    """翻译器依赖
+
+    翻译服务模块及其 HTTP 客户端在第一次请求时才加载，配置缺失只影响翻译接口。
+    """
+    from app.services.translator import get_translator as _get_translator
+
+    try:
+        return _get_translator()
+    except RuntimeError as e:
+        logger.error(f"翻译服务初始化失败: {e}")
+        raise HTTPException(status_code=503, detail="翻译服务未配置")
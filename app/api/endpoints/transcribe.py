@@ -1,33 +1,119 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi.responses import PlainTextResponse
 from app.services.transcriber import Transcriber, TimestampedText
-from app.services.stream_handler import StreamHandler
+from app.services.stream_worker import StreamWorkerPool, MSG_SEGMENTS, MSG_ERROR, MSG_DONE, MSG_LAG
+from app.services.lag_monitor import CATCHUP_POLICIES
+from app.services.transcription_cache import TranscriptionCache
+from app.services.subtitle_track import SubtitleTrack
+from app.utils.subtitle import SUBTITLE_FORMATS, render_vtt, render_srt
+from app.services.translation_scheduler import SchedulerOverloaded, PRIORITY_LIVE
+from app.api.dependencies import get_translator
 from pydantic import BaseModel
 import asyncio
+import hashlib
 import logging
 import uuid
-from typing import Dict, Any, List, Optional
+from urllib.parse import urlencode
+from typing import Dict, Any, List, Optional, Tuple
 
 router = APIRouter()
-transcriber = Transcriber()
+transcription_cache = TranscriptionCache()
+UPLOAD_READ_SIZE = 64 * 1024
 # 用于存储和跟踪活动任务
 active_tasks: Dict[str, Dict[str, Any]] = {}
+# 进行中的字幕翻译: (文本, 源语言, 目标语言) -> 翻译任务
+_subtitle_translations: Dict[Tuple[str, str, str], asyncio.Future] = {}
 logger = logging.getLogger(__name__)
 
 
+def _on_stream_message(kind: int, task_id: str, payload: Any):
+    """处理工作进程回传的流转录消息"""
+    task_info = active_tasks.get(task_id)
+    if task_info is None:
+        return
+
+    if kind == MSG_SEGMENTS:
+        start, items = payload
+        segments = task_info["segments"]
+        segments[start:] = [TimestampedText(*item) for item in items]
+
+        # 最终结果不会再被替换，依次提交到字幕轨道
+        subtitles = task_info["subtitles"]
+        while len(subtitles.cues) < len(segments) and segments[len(subtitles.cues)].is_final:
+            subtitles.add(segments[len(subtitles.cues)])
+        # 中间结果所在的分片要等它定稿后才发布
+        interim = segments[-1] if segments and not segments[-1].is_final else None
+        subtitles.set_pending(interim.start_time if interim is not None else None)
+    elif kind == MSG_LAG:
+        wall_lag, asr_lag, catching_up, media_skipped, media_position = payload
+        # 停顿期间没有新的最终结果，按识别服务已处理的媒体位置推进字幕分片
+        task_info["subtitles"].advance(media_position)
+        task_info["lag"] = LagResponse(
+            wall_lag=wall_lag,
+            asr_lag=asr_lag,
+            catching_up=catching_up,
+            media_skipped=media_skipped
+        )
+    elif kind == MSG_ERROR:
+        task_info["error"] = payload
+    elif kind == MSG_DONE:
+        task_info["subtitles"].end()
+        if task_info["status"] == "running":
+            task_info["status"] = "completed"
+
+
+# 工作进程在第一个流任务提交时才启动，由应用 lifespan 负责关闭
+stream_pool = StreamWorkerPool(on_message=_on_stream_message)
+
+
 class StreamURL(BaseModel):
     url: str
     preferred_quality: str = "audio_only"
+    catchup_policy: Optional[str] = None  # 延迟超过阈值时的追赶策略，默认读取 STREAM_CATCHUP_POLICY
+    lag_threshold: Optional[float] = None  # 延迟阈值(秒)，默认读取 STREAM_LAG_THRESHOLD
 
 
 class TimestampedResponse(BaseModel):
     text: str
     start_time: float
     end_time: float
+    is_final: bool = True
+
+
+class LagResponse(BaseModel):
+    wall_lag: float  # 墙钟时间与已处理媒体时长之差(秒)
+    asr_lag: float  # 已发送媒体时长与最后识别结果结束时间之差(秒)
+    catching_up: bool
+    media_skipped: float  # 追赶时丢弃的媒体时长(秒)
 
 
 class TranscriptionResponse(BaseModel):
     transcription: str
     timestamps: Optional[List[TimestampedResponse]] = None
+    lag: Optional[LagResponse] = None
+
+
+def _build_response(text: str, segments: List[TimestampedText], include_timestamps: bool) -> TranscriptionResponse:
+    """根据转录结果构建响应"""
+    if include_timestamps:
+        return TranscriptionResponse(
+            transcription=text,
+            timestamps=[TimestampedResponse(
+                text=item.text,
+                start_time=item.start_time,
+                end_time=item.end_time,
+                is_final=item.is_final
+            ) for item in segments]
+        )
+    return TranscriptionResponse(transcription=text)
+
+
+def _recognize(transcriber: Transcriber, audio_data: bytes) -> bool:
+    """按实时速率发送整段音频并等待识别结束，返回会话是否正常结束；耗时与音频时长相当，需在线程中运行"""
+    transcriber.connect()
+    transcriber.send(audio_data)
+    transcriber.send_end_tag()
+    return transcriber.wait_for_completion()
 
 
 @router.post("/transcribe/", response_model=TranscriptionResponse)
@@ -37,29 +123,37 @@ async def transcribe(audio_file: UploadFile = File(...), include_timestamps: boo
         audio_file: 音频文件
         include_timestamps: 是否包含时间戳信息
     """
+    # 边读取边计算内容哈希，相同音频直接返回缓存结果
+    hasher = hashlib.sha256()
+    chunks = []
+    while chunk := await audio_file.read(UPLOAD_READ_SIZE):
+        hasher.update(chunk)
+        chunks.append(chunk)
+    audio_data = b"".join(chunks)
+    cache_key = hasher.hexdigest()
+
+    cached = await asyncio.to_thread(transcription_cache.get, cache_key)
+    if cached is not None:
+        text, segments = cached
+        logger.info(f"命中转录缓存: {cache_key}")
+        return _build_response(text, segments, include_timestamps)
+
+    # 每个请求使用独立的识别会话，避免并发上传互相干扰
+    transcriber = Transcriber()
     try:
-        audio_data = await audio_file.read()
-
-        transcriber.connect()
-        transcriber.send(audio_data)
-        transcriber.send_end_tag()
-
-        result = transcriber.get_transcription(include_timestamps=include_timestamps)
-        if include_timestamps:
-            return TranscriptionResponse(
-                transcription="".join(item.text for item in result),
-                timestamps=[TimestampedResponse(
-                    text=item.text,
-                    start_time=item.start_time,
-                    end_time=item.end_time
-                ) for item in result]
-            )
-        return TranscriptionResponse(transcription=result)
+        completed = await asyncio.to_thread(_recognize, transcriber, audio_data)
+
+        segments = transcriber.get_transcription(include_timestamps=True)
+        text = "".join(item.text for item in segments)
+        # 只缓存正常结束的会话结果，出错或连接中断时的结果可能不完整
+        if completed and all(item.is_final for item in segments):
+            await asyncio.to_thread(transcription_cache.put, cache_key, text, segments)
+        return _build_response(text, segments, include_timestamps)
     except Exception as e:
         logger.error(f"转录处理错误: {str(e)}")
         raise HTTPException(status_code=500, detail=f"转录处理错误: {str(e)}")
     finally:
-        transcriber.close()
+        await asyncio.to_thread(transcriber.close)
 
 
 @router.post("/transcribe/stream/")
@@ -69,63 +163,33 @@ async def transcribe_stream(stream_data: StreamURL, include_timestamps: bool = F
         stream_data: 流媒体URL信息
         include_timestamps: 是否包含时间戳信息
     """
-    try:
-        stream_handler = StreamHandler(
-            url=stream_data.url,
-            preferred_quality=stream_data.preferred_quality
-        )
-        transcriber.connect()
-        process = stream_handler.open_stream()
-        
-        if not process:
-            raise HTTPException(status_code=500, detail="无法打开流")
+    if stream_data.catchup_policy is not None and stream_data.catchup_policy not in CATCHUP_POLICIES:
+        raise HTTPException(status_code=400, detail=f"不支持的追赶策略: {stream_data.catchup_policy}")
+    if stream_data.lag_threshold is not None and stream_data.lag_threshold <= 0:
+        raise HTTPException(status_code=400, detail="延迟阈值必须大于0")
 
+    try:
         # 生成唯一任务ID
         task_id = str(uuid.uuid4())
-
-        async def process_stream():
-            try:
-                while True:
-                    # 避免阻塞
-                    in_bytes = await asyncio.to_thread(process.stdout.read1, 4096)
-                    if not in_bytes:
-                        break
-
-                    transcriber.send(in_bytes)
-
-                    # 更新任务状态和当前文本
-                    result = transcriber.get_transcription(include_timestamps=include_timestamps)
-                    if include_timestamps:
-                        active_tasks[task_id]["current_text"] = "".join(item.text for item in result)
-                        active_tasks[task_id]["timestamps"] = [
-                            {
-                                "text": item.text,
-                                "start_time": item.start_time,
-                                "end_time": item.end_time
-                            } for item in result
-                        ]
-                    else:
-                        active_tasks[task_id]["current_text"] = result
-                    
-            except Exception as e:
-                logger.error(f"流处理错误: {str(e)}")
-                active_tasks[task_id]["error"] = str(e)
-            finally:
-                # 确保资源清理
-                stream_handler.close()
-                transcriber.close()
-                active_tasks[task_id]["status"] = "completed"
-
-        # 创建并存储任务
-        task = asyncio.create_task(process_stream())
         active_tasks[task_id] = {
-            "task": task,
             "status": "running",
-            "current_text": "",
-            "timestamps": [] if include_timestamps else None,
+            "include_timestamps": include_timestamps,
+            "segments": [],
+            "subtitles": SubtitleTrack(),
+            "lag": None,
             "error": None
         }
 
+        # 流的读取、切片与识别在工作进程中完成，结果通过回调写回 active_tasks
+        await asyncio.to_thread(
+            stream_pool.submit,
+            task_id,
+            stream_data.url,
+            stream_data.preferred_quality,
+            stream_data.catchup_policy,
+            stream_data.lag_threshold
+        )
+
         return {
             "message": "Stream processing started", 
             "task_id": task_id
@@ -143,13 +207,102 @@ async def get_transcription_status(task_id: str):
         raise HTTPException(status_code=404, detail="任务不存在")
     
     task_info = active_tasks[task_id]
+    segments = list(task_info["segments"])
     
     return TranscriptionResponse(
-        transcription=task_info["current_text"],
-        timestamps=task_info.get("timestamps")
+        transcription="".join(item.text for item in segments),
+        timestamps=[TimestampedResponse(
+            text=item.text,
+            start_time=item.start_time,
+            end_time=item.end_time,
+            is_final=item.is_final
+        ) for item in segments] if task_info["include_timestamps"] else None,
+        lag=task_info["lag"]
     )
 
 
+async def _translate_cue(translator, task_id: str, text: str, source_lang: str, lang: str) -> str:
+    """翻译一条字幕
+
+    多个播放器同时拉取同一分片时，相同 (文本, 语言) 的翻译只发起一次请求并共享结果，
+    避免重复请求占满该任务的排队名额。
+    """
+    key = (text, source_lang, lang)
+    pending = _subtitle_translations.get(key)
+    if pending is None:
+        pending = asyncio.ensure_future(translator.translate(
+            text=text, source_lang=source_lang, target_lang=lang,
+            priority=PRIORITY_LIVE, client_id=task_id
+        ))
+        _subtitle_translations[key] = pending
+        pending.add_done_callback(lambda _: _subtitle_translations.pop(key, None))
+    # 单个请求被取消时不影响共享同一翻译的其他请求
+    return await asyncio.shield(pending)
+
+
+@router.get("/transcribe/subtitles/{task_id}/playlist.m3u8")
+async def get_subtitle_playlist(task_id: str, format: str = "vtt", lang: Optional[str] = None,
+                                source_lang: str = "zh"):
+    """获取直播字幕的 HLS 播放列表，只列出最近的字幕分片
+    Args:
+        format: 分片格式，vtt 或 srt
+        lang: 翻译字幕的目标语言，不传则为原文字幕
+        source_lang: 原文语言
+    """
+    if task_id not in active_tasks:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if format not in SUBTITLE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的字幕格式: {format}")
+
+    query = urlencode({"lang": lang, "source_lang": source_lang}) if lang else ""
+    uri_template = f"{{seq}}.{format}" + (f"?{query}" if query else "")
+    return PlainTextResponse(
+        active_tasks[task_id]["subtitles"].playlist(uri_template),
+        media_type="application/vnd.apple.mpegurl"
+    )
+
+
+@router.get("/transcribe/subtitles/{task_id}/{seq}.{format}")
+async def get_subtitle_segment(task_id: str, seq: int, format: str, lang: Optional[str] = None,
+                               source_lang: str = "zh"):
+    """获取一个已发布的字幕分片
+    Args:
+        seq: 分片序号
+        format: 分片格式，vtt 或 srt
+        lang: 翻译字幕的目标语言，不传则为原文字幕
+        source_lang: 原文语言
+    """
+    if task_id not in active_tasks:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if format not in SUBTITLE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的字幕格式: {format}")
+
+    try:
+        cues = active_tasks[task_id]["subtitles"].segment(seq)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="字幕分片不存在")
+
+    if lang and cues:
+        translator = get_translator()
+        try:
+            texts = await asyncio.gather(*(
+                _translate_cue(translator, task_id, text, source_lang, lang)
+                for _, _, _, text in cues
+            ))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"无效的语言代码: {e}")
+        except SchedulerOverloaded:
+            raise HTTPException(status_code=429, detail="翻译服务繁忙，请稍后重试")
+        except Exception as e:
+            logger.error(f"字幕翻译失败, task_id={task_id}, seq={seq}, error={e}")
+            raise HTTPException(status_code=500, detail="翻译服务暂时不可用")
+        cues = [(index, start, end, text) for (index, start, end, _), text in zip(cues, texts)]
+
+    if format == "vtt":
+        return PlainTextResponse(render_vtt(cues, hls=True), media_type="text/vtt")
+    return PlainTextResponse(render_srt(cues), media_type="application/x-subrip")
+
+
 @router.delete("/transcribe/cancel/{task_id}")
 async def cancel_transcription(task_id: str):
     """取消正在进行的转录任务"""
@@ -159,10 +312,9 @@ async def cancel_transcription(task_id: str):
     task_info = active_tasks[task_id]
     
     if task_info["status"] == "running":
-        task_info["task"].cancel()
         task_info["status"] = "cancelled"
         
-        # 清理资源
-        transcriber.close()
+        # 通知工作进程停止并清理资源
+        stream_pool.cancel(task_id)
         
     return {"message": f"任务 {task_id} 已取消"}
@@ -1,42 +1,84 @@
-from fastapi import APIRouter, HTTPException, Form, UploadFile
+from fastapi import APIRouter, HTTPException, Form, UploadFile, Depends, Request
 from fastapi.responses import StreamingResponse
-from app.services.translator import translator
+from app.api.dependencies import get_translator
 from app.utils.language import LANGUAGE_MAPPING
-from typing import Optional
+from app.services.translation_scheduler import SchedulerOverloaded, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+from typing import List, Optional
 import logging
 
 router = APIRouter(prefix="/translate", tags=["translation"])
 logger = logging.getLogger(__name__)
 
+# 客户端可声明的优先级，直播字幕优先级仅供内部使用
+CLIENT_PRIORITIES = {
+    "interactive": PRIORITY_INTERACTIVE,
+    "batch": PRIORITY_BATCH,
+}
+
+
+def _client_id(request: Request) -> str:
+    """用于公平排队的客户端标识"""
+    return request.headers.get("X-Client-Id") or (request.client.host if request.client else "anonymous")
+
+
 @router.post("/text")
 async def translate_text(
+    request: Request,
     text: str = Form(..., description="要翻译的文本"),
     source_lang: str = Form(..., description="源语言代码，如 'zh', 'en'"),
-    target_lang: str = Form(..., description="目标语言代码，如 'en', 'zh'")
+    target_lang: List[str] = Form(..., description="目标语言代码，如 'en', 'zh'；可重复传入或用逗号分隔以同时翻译成多种语言"),
+    priority: str = Form("interactive", description="调度优先级，'interactive' 或 'batch'"),
+    translator=Depends(get_translator)
 ):
     """
     文本翻译接口
+
+    单个目标语言返回 translated_text，多个目标语言返回 translations
     """
+    target_langs = [lang.strip() for value in target_lang for lang in value.split(",") if lang.strip()]
+    if not target_langs:
+        raise HTTPException(status_code=400, detail="缺少目标语言")
+    if priority not in CLIENT_PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"不支持的优先级: {priority}")
+    client_id = _client_id(request)
+
     try:
-        translated_text = await translator.translate(
+        if len(target_langs) == 1:
+            translated_text = await translator.translate(
+                text=text,
+                source_lang=source_lang,
+                target_lang=target_langs[0],
+                stream=False,
+                priority=CLIENT_PRIORITIES[priority],
+                client_id=client_id
+            )
+            return {"translated_text": translated_text}
+
+        translations = await translator.translate_many(
             text=text,
             source_lang=source_lang,
-            target_lang=target_lang,
-            stream=False
+            target_langs=target_langs,
+            priority=CLIENT_PRIORITIES[priority],
+            client_id=client_id
         )
-        return {"translated_text": translated_text}
+        return {"translations": translations}
     except ValueError as e:
         logger.error(f"源语言或目标语言无效: {e}")
         raise HTTPException(status_code=400, detail=f"无效的语言代码: {e}")
+    except SchedulerOverloaded as e:
+        logger.warning(f"翻译请求被拒绝, client_id={client_id}, error={e}")
+        raise HTTPException(status_code=429, detail="翻译服务繁忙，请稍后重试")
     except Exception as e:
-        logger.error(f"翻译失败, text={text}, source_lang={source_lang}, target_lang={target_lang}, error={e}")
+        logger.error(f"翻译失败, text={text}, source_lang={source_lang}, target_lang={target_langs}, error={e}")
         raise HTTPException(status_code=500, detail="翻译服务暂时不可用")
 
 @router.post("/stream")
 async def translate_text_stream(
+    request: Request,
     text: str = Form(..., description="要翻译的文本"),
     source_lang: str = Form(..., description="源语言代码，如 'zh', 'en'"),
-    target_lang: str = Form(..., description="目标语言代码，如 'en', 'zh'")
+    target_lang: str = Form(..., description="目标语言代码，如 'en', 'zh'"),
+    translator=Depends(get_translator)
 ):
     """
     流式文本翻译接口
@@ -47,7 +89,8 @@ async def translate_text_stream(
                 text=text,
                 source_lang=source_lang,
                 target_lang=target_lang,
-                stream=True
+                stream=True,
+                client_id=_client_id(request)
             ),
             media_type="text/event-stream"
         )
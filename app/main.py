@@ -1,14 +1,27 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from dotenv import load_dotenv
 import os
+import sys
 
 # 加载环境变量
 load_dotenv()
 
-from app.api.endpoints.transcribe import router as transcribe_router
+from app.api.endpoints.transcribe import router as transcribe_router, stream_pool
 from app.api.endpoints.translate import router as translate_router
 
-app = FastAPI(title="Live Speech Transcription API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """服务在首次使用时才初始化，这里只负责关闭已创建的资源"""
+    yield
+    stream_pool.shutdown()
+    if "app.services.translator" in sys.modules:
+        from app.services.translator import close_translator
+        await close_translator()
+
+
+app = FastAPI(title="Live Speech Transcription API", lifespan=lifespan)
 
 app.include_router(transcribe_router, prefix="/api")
 app.include_router(translate_router, prefix="/api")
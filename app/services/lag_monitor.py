@@ -0,0 +1,91 @@
+import os
+import time
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+BYTES_PER_SECOND = SAMPLE_RATE * 2  # 16bit 单声道 PCM
+
+# 追赶策略
+CATCHUP_NONE = "none"                  # 只记录延迟，不做处理
+CATCHUP_DROP_SILENCE = "drop_silence"  # 丢弃静音帧
+CATCHUP_BURST = "burst"                # 不限速突发发送
+CATCHUP_SKIP_TO_LIVE = "skip_to_live"  # 丢弃积压音频直接跳到直播点
+CATCHUP_POLICIES = (CATCHUP_NONE, CATCHUP_DROP_SILENCE, CATCHUP_BURST, CATCHUP_SKIP_TO_LIVE)
+
+
+class LagMonitor:
+    """实时延迟监控
+
+    跟踪两项延迟:
+    - wall_lag: 自开始以来的墙钟时间与已处理媒体时长之差，即管道中积压的音频
+    - asr_lag: 已发送给识别服务但尚未得到识别结果的音频时长，由识别会话提供，不含跳过的音频
+    wall_lag 超过阈值时进入追赶状态，降到阈值一半以下时退出。
+    """
+
+    def __init__(self, policy: Optional[str] = None, threshold: Optional[float] = None,
+                 silence_rms: Optional[float] = None):
+        self.policy = policy or os.getenv('STREAM_CATCHUP_POLICY', CATCHUP_NONE)
+        self.threshold = threshold if threshold is not None else float(os.getenv('STREAM_LAG_THRESHOLD', '3.0'))
+        self.silence_rms = silence_rms if silence_rms is not None else float(os.getenv('STREAM_SILENCE_RMS', '300'))
+
+        if self.policy not in CATCHUP_POLICIES:
+            raise ValueError(f"不支持的追赶策略: {self.policy}")
+        if self.threshold <= 0:
+            raise ValueError(f"延迟阈值必须大于0: {self.threshold}")
+
+        self.started_at = None
+        self.media_sent = 0.0     # 已发送给识别服务的媒体时长(秒)
+        self.media_skipped = 0.0  # 因追赶而丢弃的媒体时长(秒)
+        self.catching_up = False
+
+    def start(self):
+        """以第一帧音频到达的时间作为起点"""
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+
+    def mark_sent(self, nbytes: int):
+        self.media_sent += nbytes / BYTES_PER_SECOND
+
+    def mark_skipped(self, nbytes: int):
+        self.media_skipped += nbytes / BYTES_PER_SECOND
+
+    @property
+    def wall_lag(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        elapsed = time.monotonic() - self.started_at
+        return max(0.0, elapsed - self.media_sent - self.media_skipped)
+
+    def update(self) -> bool:
+        """根据当前延迟更新追赶状态并返回"""
+        lag = self.wall_lag
+        if not self.catching_up and lag > self.threshold:
+            self.catching_up = True
+            logger.warning(f"直播延迟 {lag:.2f}s 超过阈值 {self.threshold:.2f}s，启用追赶策略: {self.policy}")
+        elif self.catching_up and lag < self.threshold / 2:
+            self.catching_up = False
+            logger.info(f"直播延迟已恢复到 {lag:.2f}s")
+        return self.catching_up
+
+    def is_silent(self, frame: bytes) -> bool:
+        """判断一帧 PCM 音频是否为静音"""
+        import numpy as np
+
+        samples = np.frombuffer(frame, dtype=np.int16)
+        if samples.size == 0:
+            return True
+        rms = np.sqrt(np.mean(samples.astype(np.float32) ** 2))
+        return rms < self.silence_rms
+
+    def snapshot(self, asr_lag: float, media_position: float) -> tuple:
+        """(wall_lag, asr_lag, catching_up, media_skipped, media_position)"""
+        return (
+            round(self.wall_lag, 3),
+            round(asr_lag, 3),
+            self.catching_up,
+            round(self.media_skipped, 3),
+            round(media_position, 3)
+        )
@@ -0,0 +1,175 @@
+import os
+import queue
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 4096
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv('STREAM_SUBSCRIBER_QUEUE', '256'))  # 每个订阅者最多缓存的数据块数
+
+
+class Subscriber:
+    """共享流的一个订阅者，持有独立的有界队列
+
+    队列满时丢弃最旧的数据块，慢速订阅者不会拖慢解码或其他订阅者。
+    """
+
+    def __init__(self, task_id: str, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.task_id = task_id
+        self.stream: Optional["SharedStream"] = None  # 所属的共享流
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.dropped_bytes = 0
+        self.closed = False
+
+    def put(self, data: bytes):
+        while True:
+            try:
+                self._queue.put_nowait(data)
+                return
+            except queue.Full:
+                try:
+                    self.dropped_bytes += len(self._queue.get_nowait() or b"")
+                except queue.Empty:
+                    pass
+
+    def get(self) -> Optional[bytes]:
+        """读取下一块 PCM 数据，流结束或取消订阅时返回 None"""
+        if self.closed:
+            return None
+        data = self._queue.get()
+        if data is None:
+            self.closed = True
+        return data
+
+    def take_dropped(self) -> int:
+        """取出并清零因队列满而丢弃的字节数"""
+        dropped, self.dropped_bytes = self.dropped_bytes, 0
+        return dropped
+
+    def close(self):
+        """结束订阅，唤醒阻塞中的读取"""
+        self.put(None)
+
+
+class SharedStream:
+    """同一 (url, quality) 的共享拉流与解码管道，把 PCM 数据广播给所有订阅者"""
+
+    def __init__(self, url: str, preferred_quality: str):
+        from app.services.stream_handler import StreamHandler
+
+        self.key = (url, preferred_quality)
+        self.subscribers: Dict[str, Subscriber] = {}
+        self.opened = threading.Event()
+        self.ended = False
+        self.error: Optional[Exception] = None
+        self._closing = False  # 主动关闭，读取中断属于正常结束
+        self._handler = StreamHandler(url=url, preferred_quality=preferred_quality)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def open(self):
+        """打开流并启动广播线程"""
+        try:
+            process = self._handler.open_stream()
+            self._thread = threading.Thread(target=self._broadcast, args=(process,), daemon=True)
+            self._thread.start()
+        except Exception as e:
+            self.error = e
+            raise
+        finally:
+            self.opened.set()
+
+    def _broadcast(self, process):
+        try:
+            while True:
+                in_bytes = process.stdout.read1(READ_SIZE)
+                if not in_bytes:
+                    break
+                with self._lock:
+                    subscribers = list(self.subscribers.values())
+                for subscriber in subscribers:
+                    subscriber.put(in_bytes)
+        except Exception as e:
+            if self._closing:
+                logger.info(f"共享流已关闭，停止读取: {str(e)}")
+            else:
+                logger.error(f"共享流读取错误: {str(e)}")
+        finally:
+            with self._lock:
+                self.ended = True
+                subscribers = list(self.subscribers.values())
+            for subscriber in subscribers:
+                subscriber.close()
+            logger.info(f"共享流已结束: {self.key[0]}")
+
+    def add(self, subscriber: Subscriber):
+        with self._lock:
+            self.subscribers[subscriber.task_id] = subscriber
+            subscriber.stream = self
+
+    def remove(self, task_id: str) -> int:
+        """移除订阅者，返回剩余订阅者数量"""
+        with self._lock:
+            self.subscribers.pop(task_id, None)
+            return len(self.subscribers)
+
+    def close(self):
+        self._closing = True
+        self._handler.close()
+
+
+class StreamRegistry:
+    """按 (url, quality) 引用计数的共享流注册表
+
+    第一个订阅者负责打开流，其余订阅者等待打开完成后加入；
+    最后一个订阅者退出时关闭拉流与解码进程。上游已结束的流在旧订阅者读完前仍会保留，
+    此时新的订阅者会得到一条新的管道。
+    """
+
+    def __init__(self):
+        self._streams: Dict[Tuple[str, str], SharedStream] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, task_id: str, url: str, preferred_quality: str) -> Subscriber:
+        key = (url, preferred_quality)
+        subscriber = Subscriber(task_id)
+        with self._lock:
+            stream = self._streams.get(key)
+            is_owner = stream is None or stream.ended
+            if is_owner:
+                stream = self._streams[key] = SharedStream(url, preferred_quality)
+            stream.add(subscriber)
+
+        # 打开流较慢，在注册表锁外进行
+        if is_owner:
+            try:
+                stream.open()
+            except Exception:
+                with self._lock:
+                    if self._streams.get(key) is stream:
+                        del self._streams[key]
+                raise
+            logger.info(f"已打开共享流: {url} ({preferred_quality})")
+        else:
+            stream.opened.wait()
+            if stream.error is not None:
+                stream.remove(task_id)
+                raise RuntimeError(f"打开共享流失败: {stream.error}")
+            logger.info(f"任务 {task_id} 复用共享流: {url} ({preferred_quality})，订阅者数: {len(stream.subscribers)}")
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        """取消订阅，所属共享流没有订阅者时关闭"""
+        stream = subscriber.stream
+        if stream is None:
+            return
+        with self._lock:
+            if stream.remove(subscriber.task_id) > 0:
+                return
+            # 已被新管道替换的旧流不在注册表中，只需关闭
+            if self._streams.get(stream.key) is stream:
+                del self._streams[stream.key]
+        stream.close()
+        logger.info(f"已关闭共享流: {stream.key[0]} ({stream.key[1]})")
@@ -1,6 +1,5 @@
 import subprocess
 import threading
-import streamlink
 import os
 import logging
 import time
@@ -64,9 +63,11 @@ class StreamHandler:
                 
                 return self.ffmpeg_process
 
-            # 使用 streamlink 获取音频流
+            # 使用 streamlink 获取音频流，streamlink 及其插件加载较慢，首次使用时再导入
             logger.info(f"使用streamlink获取流: {self.url}")
             try:
+                import streamlink
+
                 streams = streamlink.streams(self.url)
                 if not streams:
                     logger.error(f"未找到可用的流: {self.url}")
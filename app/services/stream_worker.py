@@ -0,0 +1,395 @@
+import os
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from typing import Callable, Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+# 工作进程 -> API 进程的消息类型，消息格式为 (kind, task_id, epoch, payload)
+# epoch 为任务的启动代数，任务随工作进程重启时递增，旧进程残留的消息据此丢弃
+MSG_SEGMENTS = 0  # payload: (start, [(text, start_time, end_time, is_final), ...])，语义为 segments[start:] = items
+MSG_ERROR = 1     # payload: 错误信息
+MSG_DONE = 2      # payload: None
+MSG_LAG = 3       # payload: (wall_lag, asr_lag, catching_up, media_skipped, media_position)
+
+# API 进程 -> 工作进程的命令
+CMD_START = "start"
+CMD_STOP = "stop"
+
+LAG_REPORT_INTERVAL = 1.0  # 延迟上报间隔(秒)
+FINAL_RESULT_TIMEOUT = 5.0  # 流结束后等待最终识别结果的时长(秒)
+
+
+def _run_stream(task_id: str, url: str, preferred_quality: str,
+                catchup_policy: Optional[str], lag_threshold: Optional[float], time_offset: float, epoch: int,
+                stop_event: threading.Event, registry, subscribers: Dict[str, Any], result_queue):
+    """在工作进程中运行单路流的转录管道
+
+    相同 (url, quality) 的任务共享同一个拉流与解码管道，每个任务从自己的订阅队列读取 PCM。
+    time_offset 为任务重新提交时已有结果的结束时间，新会话的时间戳从这里接续。
+    """
+    from app.services.transcriber import Transcriber, CHUNK_SIZE
+    from app.services.lag_monitor import LagMonitor, CATCHUP_DROP_SILENCE, CATCHUP_BURST, CATCHUP_SKIP_TO_LIVE
+
+    subscriber = None
+    transcriber = Transcriber()
+    committed = 0
+    revision = 0
+    pending = b""
+    last_report = 0.0
+
+    def emit(kind: int, payload: Any):
+        result_queue.put((kind, task_id, epoch, payload))
+
+    def send(audio_data: bytes, pace: bool = True):
+        if audio_data:
+            transcriber.send(audio_data, pace=pace)
+            monitor.mark_sent(len(audio_data))
+
+    def skip(nbytes: int):
+        """跳过的音频同时记入延迟统计和识别会话，识别结果的时间戳保持在媒体时间轴上"""
+        if nbytes:
+            monitor.mark_skipped(nbytes)
+            transcriber.mark_skipped(nbytes)
+
+    def forward_updates():
+        """只回传新增的最终结果和替换后的中间结果，避免每次复制整份转录"""
+        nonlocal committed, revision
+        finals, interim, current = transcriber.get_updates(committed)
+        if current != revision:
+            segments = finals + [interim] if interim is not None else finals
+            items = [(item.text, item.start_time, item.end_time, item.is_final) for item in segments]
+            emit(MSG_SEGMENTS, (committed, items))
+            committed += len(finals)
+            revision = current
+
+    try:
+        monitor = LagMonitor(policy=catchup_policy, threshold=lag_threshold)
+        transcriber.connect(offset=time_offset)
+        subscriber = registry.subscribe(task_id, url, preferred_quality)
+        subscribers[task_id] = subscriber
+        if stop_event.is_set():
+            subscriber.close()
+
+        while not stop_event.is_set():
+            in_bytes = subscriber.get()
+            if not in_bytes:
+                break
+            monitor.start()
+            # 订阅队列满时丢弃的数据计入跳过的媒体时长
+            skip(subscriber.take_dropped())
+
+            # 按整帧切分，余下的字节留到下一次
+            pending += in_bytes
+            size = len(pending) - len(pending) % CHUNK_SIZE
+            audio_data, pending = pending[:size], pending[size:]
+            if not audio_data:
+                continue
+
+            pace = True
+            if monitor.update():
+                if monitor.policy == CATCHUP_SKIP_TO_LIVE:
+                    skip(len(audio_data))
+                    audio_data = b""
+                elif monitor.policy == CATCHUP_DROP_SILENCE:
+                    # 按原有顺序发送有声帧、跳过静音帧，跳过的位置与媒体时间轴一一对应
+                    voiced = b""
+                    for i in range(0, len(audio_data), CHUNK_SIZE):
+                        frame = audio_data[i:i + CHUNK_SIZE]
+                        if monitor.is_silent(frame):
+                            send(voiced)
+                            voiced = b""
+                            skip(len(frame))
+                        else:
+                            voiced += frame
+                    audio_data = voiced
+                elif monitor.policy == CATCHUP_BURST:
+                    pace = False
+
+            send(audio_data, pace=pace)
+
+            forward_updates()
+
+            now = time.monotonic()
+            if now - last_report >= LAG_REPORT_INTERVAL:
+                emit(MSG_LAG, monitor.snapshot(transcriber.asr_lag, transcriber.media_position))
+                last_report = now
+
+    except Exception as e:
+        if not stop_event.is_set():
+            logger.error(f"流处理错误: {str(e)}")
+            emit(MSG_ERROR, str(e))
+    finally:
+        subscribers.pop(task_id, None)
+        if subscriber is not None:
+            registry.unsubscribe(subscriber)
+
+        # 流结束或任务取消后，等待最后一句的最终结果再回传一次
+        try:
+            transcriber.send_end_tag()
+            transcriber.wait_for_completion(FINAL_RESULT_TIMEOUT)
+            forward_updates()
+        except Exception as e:
+            logger.warning(f"等待最终识别结果时出错: {str(e)}")
+        transcriber.close()
+        emit(MSG_DONE, None)
+
+
+def _worker_main(worker_id: int, command_queue, result_queue):
+    """工作进程入口，按命令启动或停止流处理线程"""
+    from app.services.stream_fanout import StreamRegistry
+
+    registry = StreamRegistry()
+    stop_events: Dict[str, threading.Event] = {}
+    subscribers: Dict[str, Any] = {}
+    logger.info(f"流工作进程 {worker_id} 已启动 (pid={os.getpid()})")
+
+    def run(task_id: str, args: tuple, stop_event: threading.Event):
+        try:
+            _run_stream(task_id, *args, stop_event, registry, subscribers, result_queue)
+        finally:
+            # 流自然结束时也要移除，否则长期运行的工作进程会不断积累
+            if stop_events.get(task_id) is stop_event:
+                del stop_events[task_id]
+
+    while True:
+        command = command_queue.get()
+        if command is None:
+            break
+
+        op, task_id, args = command
+        if op == CMD_START:
+            stop_event = threading.Event()
+            stop_events[task_id] = stop_event
+            thread = threading.Thread(target=run, args=(task_id, args, stop_event), daemon=True)
+            thread.start()
+        elif op == CMD_STOP:
+            stop_event = stop_events.pop(task_id, None)
+            if stop_event:
+                stop_event.set()
+            # 唤醒阻塞中的读取，最后一个订阅者退出时共享管道随之关闭
+            subscriber = subscribers.get(task_id)
+            if subscriber:
+                subscriber.close()
+
+    for task_id, stop_event in list(stop_events.items()):
+        stop_event.set()
+        subscriber = subscribers.get(task_id)
+        if subscriber:
+            subscriber.close()
+    logger.info(f"流工作进程 {worker_id} 已退出")
+
+
+class StreamWorkerPool:
+    """流处理工作进程池
+
+    每个流任务被分配到负载最低的工作进程上运行，相同来源的任务共用一个工作进程；工作进程异常退出时
+    由监控线程自动重启，并重新提交其上的任务。每个工作进程有独立的结果队列和分发线程，
+    进程在写入途中被杀死时损坏的只是它自己的队列，重启时连同队列一起替换。
+    """
+
+    def __init__(self, num_workers: Optional[int] = None,
+                 on_message: Optional[Callable[[int, str, Any], None]] = None):
+        self.num_workers = num_workers or int(os.getenv('STREAM_WORKERS', '0')) or os.cpu_count() or 1
+        self.on_message = on_message
+        self._ctx = multiprocessing.get_context("spawn")
+        self._processes: List[Any] = []
+        self._command_queues: List[Any] = []
+        self._result_queues: List[Any] = []
+        self._dispatch_threads: List[threading.Thread] = []
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._stopping = False
+        self._monitor_thread = None
+
+    def start(self):
+        """启动工作进程与结果分发、监控线程"""
+        with self._lock:
+            if self._started:
+                return
+            self._stopping = False
+            self._processes = [None] * self.num_workers
+            self._command_queues = [None] * self.num_workers
+            self._result_queues = [None] * self.num_workers
+            self._dispatch_threads = [None] * self.num_workers
+            for worker_id in range(self.num_workers):
+                self._spawn_worker(worker_id)
+
+            self._monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
+            self._monitor_thread.start()
+            self._started = True
+            logger.info(f"流工作进程池已启动，进程数: {self.num_workers}")
+
+    def _spawn_worker(self, worker_id: int):
+        """创建一个工作进程及其命令、结果队列和分发线程，替换该位置上原有的进程"""
+        command_queue = self._ctx.Queue()
+        result_queue = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, command_queue, result_queue),
+            name=f"stream-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        self._processes[worker_id] = process
+        self._command_queues[worker_id] = command_queue
+        self._result_queues[worker_id] = result_queue
+        self._start_dispatcher(worker_id)
+
+    def _start_dispatcher(self, worker_id: int):
+        """启动读取指定工作进程结果队列的分发线程"""
+        thread = threading.Thread(
+            target=self._dispatch_loop,
+            args=(worker_id, self._result_queues[worker_id]),
+            name=f"stream-dispatch-{worker_id}",
+            daemon=True
+        )
+        self._dispatch_threads[worker_id] = thread
+        thread.start()
+
+    def submit(self, task_id: str, url: str, preferred_quality: str = "audio_only",
+               catchup_policy: Optional[str] = None, lag_threshold: Optional[float] = None):
+        """提交流任务"""
+        self.start()
+        with self._lock:
+            # 相同 (url, quality) 的任务分配到同一工作进程，以共享拉流与解码
+            worker_id = None
+            load = [0] * self.num_workers
+            for task in self._tasks.values():
+                if task["cancelled"]:
+                    continue
+                load[task["worker"]] += 1
+                if task["args"][:2] == (url, preferred_quality):
+                    worker_id = task["worker"]
+            if worker_id is None:
+                worker_id = load.index(min(load))
+
+            self._tasks[task_id] = {
+                "worker": worker_id,
+                "args": (url, preferred_quality, catchup_policy, lag_threshold),
+                "offset": 0,
+                "count": 0,  # 已提交的最终结果数
+                "end_time": 0.0,  # 最后一条最终结果的结束时间
+                "epoch": 0,  # 启动代数，随重启递增
+                "cancelled": False,
+            }
+            self._command_queues[worker_id].put((CMD_START, task_id, self._tasks[task_id]["args"] + (0.0, 0)))
+
+    def cancel(self, task_id: str):
+        """取消流任务
+
+        任务保留到工作进程回传 MSG_DONE 为止，以便收尾的结果和结束消息仍能送达。
+        """
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is not None and not task["cancelled"]:
+                task["cancelled"] = True
+                self._command_queues[task["worker"]].put((CMD_STOP, task_id, None))
+
+    def _dispatch_loop(self, worker_id: int, result_queue):
+        """把工作进程回传的消息分发给回调
+
+        工作进程被替换后队列随之作废，线程退出；单条消息读取或处理出错时记录日志后继续。
+        """
+        while not self._stopping and self._result_queues[worker_id] is result_queue:
+            try:
+                kind, task_id, epoch, payload = result_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except Exception as e:
+                # 工作进程在写入途中被杀死时，队列中可能残留不完整的消息
+                if self._stopping or self._result_queues[worker_id] is not result_queue:
+                    break
+                logger.error(f"读取流工作进程 {worker_id} 的消息时出错: {str(e)}")
+                time.sleep(0.1)
+                continue
+
+            with self._lock:
+                task = self._tasks.get(task_id)
+                # 丢弃已被重启替换的旧进程残留的消息
+                if task is None or task["epoch"] != epoch:
+                    continue
+                if kind == MSG_SEGMENTS:
+                    # 工作进程重启后结果序号从 0 开始，加上偏移保持连续
+                    # 末尾的中间结果不计入，重启后由新的结果覆盖
+                    start, items = payload
+                    start += task["offset"]
+                    task["count"] = start + sum(1 for item in items if item[3])
+                    task["end_time"] = max([task["end_time"]] + [item[2] for item in items if item[3]])
+                    payload = (start, items)
+                elif kind == MSG_DONE:
+                    self._tasks.pop(task_id, None)
+
+            if self.on_message:
+                try:
+                    self.on_message(kind, task_id, payload)
+                except Exception as e:
+                    logger.error(f"处理流消息时出错: {str(e)}")
+
+    def _monitor_loop(self):
+        """监控工作进程与分发线程，异常退出时自动重启"""
+        while not self._stopping:
+            time.sleep(1.0)
+            finished = []
+            with self._lock:
+                if self._stopping:
+                    break
+                for worker_id, process in enumerate(self._processes):
+                    if process.is_alive():
+                        if not self._dispatch_threads[worker_id].is_alive():
+                            logger.warning(f"流工作进程 {worker_id} 的分发线程已退出，正在重启")
+                            self._start_dispatcher(worker_id)
+                        continue
+
+                    logger.warning(f"流工作进程 {worker_id} 异常退出 (exitcode={process.exitcode})，正在重启")
+                    self._spawn_worker(worker_id)
+
+                    for task_id, task in list(self._tasks.items()):
+                        if task["worker"] != worker_id:
+                            continue
+                        # 已取消的任务不再重启，直接结束
+                        if task["cancelled"]:
+                            del self._tasks[task_id]
+                            finished.append(task_id)
+                            continue
+                        # 序号与时间戳都从已提交的结果之后接续
+                        task["offset"] = task["count"]
+                        task["epoch"] += 1
+                        self._command_queues[worker_id].put(
+                            (CMD_START, task_id, task["args"] + (task["end_time"], task["epoch"]))
+                        )
+
+            if self.on_message:
+                for task_id in finished:
+                    try:
+                        self.on_message(MSG_DONE, task_id, None)
+                    except Exception as e:
+                        logger.error(f"处理流消息时出错: {str(e)}")
+
+    def shutdown(self):
+        """停止所有工作进程"""
+        with self._lock:
+            if not self._started:
+                return
+            self._stopping = True
+            self._started = False
+            self._tasks.clear()
+            for command_queue in self._command_queues:
+                try:
+                    command_queue.put(None)
+                except Exception:
+                    pass
+
+        for process in self._processes:
+            process.join(timeout=3)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        self._command_queues = []
+        self._result_queues = []
+        self._dispatch_threads = []
+        logger.info("流工作进程池已关闭")
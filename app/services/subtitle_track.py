@@ -0,0 +1,94 @@
+import os
+import math
+from typing import Dict, List, Optional, Tuple
+from app.services.transcriber import TimestampedText
+
+
+class SubtitleTrack:
+    """直播字幕轨道
+
+    最终结果提交后按时间切分到固定时长的字幕分片中。识别服务已处理的媒体越过分片结束时间
+    (留出 settle 秒等待结果返回)且该分片内没有未定的中间结果时发布，停顿期间没有新的最终结果
+    也会按时发布；发布后内容不再变化。播放列表只列出最近 window 个分片，单次拉取的开销与直播时长无关。
+    """
+
+    def __init__(self, segment_duration: float = None, window: int = None, settle: float = None):
+        self.segment_duration = segment_duration or float(os.getenv('SUBTITLE_SEGMENT_SECONDS', '6'))
+        self.window = window or int(os.getenv('SUBTITLE_PLAYLIST_WINDOW', '10'))
+        self.settle = settle if settle is not None else float(os.getenv('SUBTITLE_SETTLE_SECONDS', '1.0'))
+        self.cues: List[TimestampedText] = []
+        self._segments: Dict[int, List[int]] = {}  # 分片序号 -> 字幕序号
+        self._committed_until = 0.0  # 最后一条最终结果的结束时间
+        self._processed_until = 0.0  # 识别服务已处理的媒体位置
+        self._pending_start: Optional[float] = None  # 当前中间结果的开始时间
+        self._published = 0
+        self.ended = False
+
+    def add(self, cue: TimestampedText):
+        """提交一条最终结果"""
+        index = len(self.cues)
+        self.cues.append(cue)
+        # 已发布的分片不再变化，迟到的结果放入第一个未发布的分片
+        first = max(int(cue.start_time // self.segment_duration), self._published)
+        last = max(first, math.ceil(cue.end_time / self.segment_duration) - 1)
+        for seq in range(first, last + 1):
+            self._segments.setdefault(seq, []).append(index)
+        self._committed_until = max(self._committed_until, cue.end_time)
+        self._update()
+
+    def advance(self, media_position: float):
+        """更新识别服务已处理的媒体位置(秒)"""
+        self._processed_until = max(self._processed_until, media_position - self.settle)
+        self._update()
+
+    def set_pending(self, start_time: Optional[float]):
+        """设置当前中间结果的开始时间，没有中间结果时为 None"""
+        self._pending_start = start_time
+        self._update()
+
+    def _update(self):
+        until = self._processed_until
+        if self._pending_start is not None:
+            until = min(until, self._pending_start)
+        until = max(until, self._committed_until)
+        self._published = max(self._published, int(until // self.segment_duration))
+
+    def end(self):
+        """直播结束，发布剩余分片"""
+        self.ended = True
+
+    @property
+    def published(self) -> int:
+        """已发布的分片数"""
+        if self.ended:
+            return max(self._published, math.ceil(self._committed_until / self.segment_duration))
+        return self._published
+
+    def segment(self, seq: int) -> List[Tuple[int, float, float, str]]:
+        """获取已发布分片中的字幕，返回 (序号, 开始时间, 结束时间, 文本)，序号从 1 开始"""
+        if seq < 0 or seq >= self.published:
+            raise KeyError(seq)
+        return [
+            (index + 1, self.cues[index].start_time, self.cues[index].end_time, self.cues[index].text)
+            for index in self._segments.get(seq, [])
+        ]
+
+    def playlist(self, uri_template: str) -> str:
+        """生成 HLS 字幕播放列表
+        Args:
+            uri_template: 分片 URI 模板，{seq} 会被替换为分片序号
+        """
+        published = self.published
+        first = max(0, published - self.window)
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{math.ceil(self.segment_duration)}",
+            f"#EXT-X-MEDIA-SEQUENCE:{first}",
+        ]
+        for seq in range(first, published):
+            lines.append(f"#EXTINF:{self.segment_duration:.3f},")
+            lines.append(uri_template.format(seq=seq))
+        if self.ended:
+            lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
@@ -6,20 +6,37 @@ import threading
 import base64
 import hmac
 import hashlib
-from websocket import create_connection, WebSocketConnectionClosedException
+import bisect
+from websocket import create_connection, WebSocketConnectionClosedException, WebSocketException
 from urllib.parse import quote
 from contextlib import contextmanager
-from threading import Lock
+from threading import RLock
+from collections import deque
 from dataclasses import dataclass
-from typing import List
+from typing import List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+CHUNK_SIZE = 1280  # 每帧 40ms 的 16k 16bit PCM
+CHUNK_INTERVAL = 0.04
+BYTES_PER_SECOND = 32000
+
+# 会话恢复: 回放缓冲区时长与重连退避参数
+REPLAY_SECONDS = float(os.getenv('ASR_REPLAY_SECONDS', '3.0'))
+RECONNECT_MAX_ATTEMPTS = 5
+RECONNECT_BASE_DELAY = 0.1
+RECONNECT_MAX_DELAY = 2.0
+
+# rtasr 结果类型: "0" 为最终结果, "1" 为中间结果
+RESULT_TYPE_FINAL = "0"
+
+
 @dataclass
 class TimestampedText:
     text: str
     start_time: float
     end_time: float
+    is_final: bool = True
 
 class WebsocketError(Exception):
     """WebSocket错误"""
@@ -35,9 +52,23 @@ class Transcriber:
         self.ws = None
         self.is_connected = False
         self.recv_thread = None
-        self.result_text = ""
-        self.timestamped_results: List[TimestampedText] = []
-        self._lock = Lock()  # 添加锁以保护并发访问
+        self.result_text = ""  # 已确定的最终结果文本
+        self.timestamped_results: List[TimestampedText] = []  # 已确定的最终结果分段
+        self.interim_result: Optional[TimestampedText] = None  # 当前语句的中间结果，会被后续结果替换
+        self.revision = 0  # 结果每次变化时递增
+        self.end_sent = False  # 是否已发送结束标记
+        self.completed = False  # 发送结束标记后服务端正常结束会话
+        self.session_error: Optional[str] = None  # 识别服务返回的错误或接收异常
+        self._lock = RLock()  # 添加锁以保护并发访问
+        self._replay = deque(maxlen=max(1, int(REPLAY_SECONDS / CHUNK_INTERVAL)))  # 最近发送的音频帧，用于恢复会话
+        self._media_sent = 0.0  # 本次会话累计发送的音频时长(秒)，跨重连连续
+        self._start_offset = 0.0  # connect 时传入的时间偏移
+        # 识别时间轴只包含已发送的音频，跳过的音频记为断点 (识别时间, 截至此处累计跳过的时长)，
+        # 据此把识别结果换算回媒体时间轴
+        self._skips: List[Tuple[float, float]] = []
+        self._media_skipped = 0.0
+        self._committed_asr_end = 0.0  # 最后一条最终结果在识别时间轴上的结束时间
+        self._last_asr_end = 0.0  # 最近一条识别结果在识别时间轴上的结束时间
 
     def _generate_signature(self) -> tuple:
         """生成 WebSocket 连接所需的签名"""
@@ -46,31 +77,94 @@ class Transcriber:
         signa = base64.b64encode(hmac.new(self.api_key.encode('utf-8'), md5, hashlib.sha1).digest()).decode('utf-8')
         return ts, signa
 
-    def connect(self):
-        """建立 WebSocket 连接"""
+    def connect(self, offset: float = 0.0):
+        """建立新的识别会话，清空之前的结果
+        Args:
+            offset: 会话结果的时间偏移(秒)，接续之前的时间轴时使用
+        """
         with self._lock:
             if self.is_connected:
                 return
 
-            # 先清理之前可能存在的连接
-            self._cleanup_connection()
+            self.result_text = ""
+            self.timestamped_results = []
+            self.interim_result = None
+            self.revision += 1
+            self.end_sent = False
+            self.completed = False
+            self.session_error = None
+            self._replay.clear()
+            self._media_sent = offset
+            self._start_offset = offset
+            self._skips = []
+            self._media_skipped = 0.0
+            self._committed_asr_end = offset
+            self._last_asr_end = offset
+            self._open_session(offset)
+
+    def _open_session(self, offset: float):
+        """建立 WebSocket 连接，offset 为新会话时间轴相对全局时间轴的偏移(秒)"""
+        # 先清理之前可能存在的连接
+        self._cleanup_connection()
+
+        try:
+            ts, signa = self._generate_signature()
+            ws_url = f"{self.base_url}?appid={self.app_id}&ts={ts}&signa={quote(signa)}"
+            self.ws = create_connection(ws_url)
+            self.is_connected = True
 
+            self.recv_thread = threading.Thread(target=self.recv, args=(self.ws, offset))
+            self.recv_thread.daemon = True  # 设置为守护线程
+            self.recv_thread.start()
+
+            logger.info("WebSocket连接建立成功")
+        except Exception as e:
+            self.is_connected = False
+            self.ws = None
+            logger.error(f"WebSocket连接失败: {str(e)}")
+            raise WebsocketError(f"WebSocket连接失败: {str(e)}")
+
+    def _resume(self):
+        """恢复会话
+
+        在锁外按指数退避重连，连接成功后回放缓冲区中尚未得到最终结果的音频，
+        新会话的结果按回放起点加上时间偏移，保证时间轴单调。
+        """
+        delay = RECONNECT_BASE_DELAY
+        for attempt in range(1, RECONNECT_MAX_ATTEMPTS + 1):
             try:
-                ts, signa = self._generate_signature()
-                ws_url = f"{self.base_url}?appid={self.app_id}&ts={ts}&signa={quote(signa)}"
-                self.ws = create_connection(ws_url)
-                self.is_connected = True
+                with self._lock:
+                    if self.is_connected and self.ws:
+                        return
 
-                self.recv_thread = threading.Thread(target=self.recv)
-                self.recv_thread.daemon = True  # 设置为守护线程
-                self.recv_thread.start()
+                    # 已有最终结果覆盖的音频无需回放
+                    committed_end = self._committed_asr_end
+                    offset = self._media_sent - sum(len(frame) for frame in self._replay) / BYTES_PER_SECOND
+                    frames = []
+                    for frame in self._replay:
+                        frame_end = offset + len(frame) / BYTES_PER_SECOND
+                        if frame_end <= committed_end + 1e-6 and not frames:
+                            offset = frame_end
+                            continue
+                        frames.append(frame)
 
-                logger.info("WebSocket连接建立成功")
+                    self._open_session(offset)
+                    # 旧连接的接收异常已由恢复处理，不应让会话被判定为出错
+                    self.session_error = None
+                    # 中间结果会由回放的音频重新识别
+                    self.interim_result = None
+                    self.revision += 1
+                    for frame in frames:
+                        self.ws.send(frame)
+
+                logger.info(f"识别会话已恢复，回放 {len(frames)} 帧，时间偏移 {offset:.2f}s")
+                return
             except Exception as e:
-                self.is_connected = False
-                self.ws = None
-                logger.error(f"WebSocket连接失败: {str(e)}")
-                raise WebsocketError(f"WebSocket连接失败: {str(e)}")
+                if attempt == RECONNECT_MAX_ATTEMPTS:
+                    raise WebsocketError(f"恢复识别会话失败: {str(e)}")
+                logger.warning(f"恢复识别会话失败(第{attempt}次)，{delay:.1f}s 后重试: {str(e)}")
+                time.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
 
     def _cleanup_connection(self):
         """清理已有连接"""
@@ -82,108 +176,211 @@ class Transcriber:
             self.ws = None
         self.is_connected = False
 
-    def send(self, audio_data: bytes):
-        """发送音频数据"""
-        if not self.is_connected or not self.ws:
-            try:
-                self.connect()
-            except WebsocketError as e:
-                logger.error(f"发送时无法连接WebSocket: {str(e)}")
-                raise
-
-        chunk_size = 1280
+    def send(self, audio_data: bytes, pace: bool = True):
+        """发送音频数据
+        Args:
+            audio_data: 音频数据
+            pace: 是否按实时速率限速发送，追赶延迟时可关闭
+        """
         try:
-            for i in range(0, len(audio_data), chunk_size):
-                with self._lock:
-                    if not self.is_connected:
-                        raise WebsocketError("WebSocket连接已断开")
-
-                    chunk = audio_data[i:i + chunk_size]
-                    self.ws.send(chunk)
-                    time.sleep(0.04)  # 控制发送速率
-        except WebSocketConnectionClosedException:
-            # 尝试重连
-            logger.warning("发送时WebSocket连接断开，尝试重连")
-            self.connect()
-            # 重新发送这个数据包
-            self.send(audio_data)
+            for i in range(0, len(audio_data), CHUNK_SIZE):
+                self._send_chunk(audio_data[i:i + CHUNK_SIZE])
+                if pace:
+                    time.sleep(CHUNK_INTERVAL)  # 控制发送速率
+        except WebsocketError as e:
+            logger.error(f"发送音频数据时出错: {str(e)}")
+            raise
         except Exception as e:
             logger.error(f"发送音频数据时出错: {str(e)}")
             raise WebsocketError(f"发送音频数据时出错: {str(e)}")
 
+    def _send_chunk(self, chunk: bytes):
+        """发送一帧音频，连接断开时恢复会话后继续发送，不重发已送达的音频"""
+        for _ in range(2):
+            with self._lock:
+                if self.is_connected and self.ws:
+                    try:
+                        self.ws.send(chunk)
+                        self._replay.append(chunk)
+                        self._media_sent += len(chunk) / BYTES_PER_SECOND
+                        return
+                    except (WebSocketException, OSError) as e:
+                        # 连接关闭、断管、连接被重置等都按断线处理
+                        logger.warning(f"发送时WebSocket连接断开，尝试恢复会话: {str(e)}")
+                        self._cleanup_connection()
+            self._resume()
+        raise WebsocketError("WebSocket连接已断开")
+
+    def mark_skipped(self, nbytes: int):
+        """记录在当前位置跳过(未发送)的音频，之后的识别结果时间向后顺延"""
+        if nbytes <= 0:
+            return
+        with self._lock:
+            self._media_skipped += nbytes / BYTES_PER_SECOND
+            if self._skips and self._skips[-1][0] == self._media_sent:
+                self._skips[-1] = (self._media_sent, self._media_skipped)
+            else:
+                self._skips.append((self._media_sent, self._media_skipped))
+            # 新的识别结果不会早于最后一条最终结果，更早的断点不再需要
+            index = bisect.bisect_right(self._skips, (self._committed_asr_end, float("inf")))
+            if index > 1:
+                del self._skips[:index - 1]
+
+    def _to_media_time(self, asr_time: float, is_end: bool = False) -> float:
+        """把识别时间轴上的时间换算到媒体时间轴；恰好落在断点上的结束时间属于断点之前"""
+        if is_end:
+            index = bisect.bisect_left(self._skips, (asr_time, float("-inf")))
+        else:
+            index = bisect.bisect_right(self._skips, (asr_time, float("inf")))
+        return asr_time + (self._skips[index - 1][1] if index else 0.0)
+
     def send_end_tag(self):
         """发送结束标记"""
         with self._lock:
             if self.is_connected and self.ws:
                 try:
                     self.ws.send(self.end_tag.encode('utf-8'))
+                    self.end_sent = True
                     logger.info("结束标记发送成功")
                 except Exception as e:
                     logger.error(f"发送结束标记时出错: {str(e)}")
                     raise WebsocketError(f"发送结束标记时出错: {str(e)}")
 
-    def recv(self):
-        """接收识别结果"""
+    def recv(self, ws, offset: float = 0.0):
+        """接收识别结果
+        Args:
+            ws: 本接收线程所属的连接
+            offset: 该会话结果的时间偏移(秒)
+        """
         try:
-            while self.is_connected and self.ws:
+            while self.ws is ws:
                 try:
-                    result = self.ws.recv()
+                    result = ws.recv()
                     if not result:
                         logger.info("接收结果结束")
+                        self._mark_finished(ws)
                         break
 
                     result_dict = json.loads(result)
-                    self._handle_result(result_dict)
+                    self._handle_result(result_dict, offset)
                 except WebSocketConnectionClosedException:
                     logger.warning("WebSocket连接已关闭")
+                    self._mark_finished(ws)
                     break
                 except json.JSONDecodeError:
                     logger.warning("接收到无效的JSON数据")
                     continue
                 except Exception as e:
                     logger.error(f"接收数据时出错: {str(e)}")
+                    self._set_session_error(ws, str(e))
                     break
 
         except Exception as e:
             logger.error(f"接收线程出错: {str(e)}")
+            self._set_session_error(ws, str(e))
         finally:
+            # 会话恢复后旧线程退出时不应影响新连接的状态
             with self._lock:
-                self.is_connected = False
+                if self.ws is ws:
+                    self.is_connected = False
 
-    def _handle_result(self, result_dict: dict):
-        """处理识别结果"""
-        if result_dict.get("action") == "result":
-            try:
-                data = json.loads(result_dict["data"])
-                words = []
-                start_time = None
-                end_time = None
-                
-                for rt in data['cn']['st']['rt']:
-                    # 获取时间戳信息
-                    if 'begin' in rt:
-                        start_time = rt['begin'] / 1000  # 转换为秒
-                    if 'end' in rt:
-                        end_time = rt['end'] / 1000  # 转换为秒
-                    
-                    for ws in rt['ws']:
-                        for cw in ws['cw']:
-                            words.append(cw['w'])
-                
-                word = ''.join(words)
-                if word and start_time is not None and end_time is not None:
-                    with self._lock:
+    def _set_session_error(self, ws, error: str):
+        """记录接收异常，已被恢复替换的旧连接上的异常忽略"""
+        with self._lock:
+            if self.ws is ws:
+                self.session_error = error
+
+    def _mark_finished(self, ws):
+        """服务端关闭连接时，若已发送结束标记且没有出错，则认为会话正常结束"""
+        with self._lock:
+            if self.ws is ws and self.end_sent and self.session_error is None:
+                self.completed = True
+
+    def _handle_result(self, result_dict: dict, offset: float = 0.0):
+        """处理识别结果
+
+        中间结果只保留一份并被后续结果替换，最终结果才会追加到转录中。
+        offset 为所属会话的时间偏移，恢复会话后回放音频产生的重复最终结果会被丢弃。
+        """
+        action = result_dict.get("action")
+        if action == "error":
+            self.session_error = f"{result_dict.get('code')}: {result_dict.get('desc')}"
+            logger.error(f"识别服务返回错误: {self.session_error}")
+            return
+        if action != "result":
+            return
+
+        try:
+            data = result_dict["data"]
+            if isinstance(data, str):
+                data = json.loads(data)
+            st = data['cn']['st']
+
+            words = []
+            last_we = 0
+            start_time = None
+            end_time = None
+            for rt in st['rt']:
+                # 兼容旧格式中直接携带在 rt 上的时间戳
+                if 'begin' in rt:
+                    start_time = rt['begin'] / 1000  # 转换为秒
+                if 'end' in rt:
+                    end_time = rt['end'] / 1000  # 转换为秒
+
+                for ws in rt['ws']:
+                    last_we = max(last_we, int(ws.get('we', 0)))
+                    for cw in ws['cw']:
+                        words.append(cw['w'])
+
+            # bg/ed 单位为毫秒；中间结果的 ed 为 0，用最后一个词的结束帧(10ms)估算
+            if 'bg' in st:
+                start_time = int(st['bg']) / 1000
+                end_ms = int(st.get('ed', 0))
+                end_time = end_ms / 1000 if end_ms else start_time + last_we / 100
+
+            is_final = str(st.get('type', RESULT_TYPE_FINAL)) == RESULT_TYPE_FINAL
+            word = ''.join(words)
+            if start_time is None or end_time is None:
+                return
+            asr_end = end_time + offset
+
+            with self._lock:
+                start_time = self._to_media_time(start_time + offset)
+                end_time = self._to_media_time(asr_end, is_end=True)
+                segment = TimestampedText(
+                    text=word,
+                    start_time=start_time,
+                    end_time=end_time,
+                    is_final=is_final
+                )
+                self._last_asr_end = max(self._last_asr_end, asr_end)
+                if is_final:
+                    self.interim_result = None
+                    duplicate = bool(self.timestamped_results) and end_time <= self.timestamped_results[-1].end_time
+                    if word and not duplicate:
                         self.result_text += word
-                        self.timestamped_results.append(
-                            TimestampedText(
-                                text=word,
-                                start_time=start_time,
-                                end_time=end_time
-                            )
-                        )
+                        self.timestamped_results.append(segment)
+                        self._committed_asr_end = asr_end
+                else:
+                    self.interim_result = segment if word else None
+                self.revision += 1
+
+            if is_final:
                 logger.info(f"识别结果: {word} (时间: {start_time:.2f}s - {end_time:.2f}s)")
-            except Exception as e:
-                logger.error(f"解析识别结果时出错: {str(e)}")
+        except Exception as e:
+            logger.error(f"解析识别结果时出错: {str(e)}")
+
+    def wait_for_completion(self, timeout: float = 10.0) -> bool:
+        """发送结束标记后等待识别服务返回剩余结果并关闭连接
+        Returns:
+            会话是否正常结束：已发送结束标记、服务端正常关闭且没有任何错误
+        """
+        thread = self.recv_thread
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                return False
+        return self.completed
 
     def close(self):
         """关闭连接"""
@@ -207,13 +404,49 @@ class Transcriber:
             include_timestamps: 是否包含时间戳信息
         Returns:
             如果 include_timestamps 为 True，返回带时间戳的结果列表
-            否则返回纯文本结果
+            否则返回纯文本结果；两者都包含当前的中间结果
         """
         with self._lock:
             if include_timestamps:
-                return self.timestamped_results
+                if self.interim_result is not None:
+                    return self.timestamped_results + [self.interim_result]
+                return list(self.timestamped_results)
+            if self.interim_result is not None:
+                return self.result_text + self.interim_result.text
             return self.result_text
 
+    @property
+    def last_end_time(self) -> float:
+        """最近一条识别结果的结束时间(秒)"""
+        with self._lock:
+            if self.interim_result is not None:
+                return self.interim_result.end_time
+            if self.timestamped_results:
+                return self.timestamped_results[-1].end_time
+            return self._start_offset
+
+    @property
+    def media_position(self) -> float:
+        """已发送或跳过的音频在媒体时间轴上的位置(秒)，包含 connect 时的时间偏移"""
+        with self._lock:
+            return self._media_sent + self._media_skipped
+
+    @property
+    def asr_lag(self) -> float:
+        """已发送但尚未得到识别结果的音频时长(秒)，不含跳过的音频"""
+        with self._lock:
+            return max(0.0, self._media_sent - self._last_asr_end)
+
+    def get_updates(self, since: int) -> Tuple[List[TimestampedText], Optional[TimestampedText], int]:
+        """获取增量结果
+        Args:
+            since: 调用方已确认的最终结果分段数
+        Returns:
+            (新增的最终结果分段, 当前中间结果, 结果版本号)
+        """
+        with self._lock:
+            return self.timestamped_results[since:], self.interim_result, self.revision
+
     def __enter__(self):
         """上下文管理器支持"""
         self.connect()
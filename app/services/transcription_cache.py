@@ -0,0 +1,111 @@
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from app.services.transcriber import TimestampedText
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.cache/transcriptions"))
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class TranscriptionCache:
+    """以音频内容哈希为键的磁盘转录缓存
+
+    每个条目为一个 JSON 文件，同时保存纯文本与时间戳；
+    按文件总大小做 LRU 淘汰，访问顺序通过文件修改时间在重启后恢复。
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.directory = directory or os.getenv('TRANSCRIBE_CACHE_DIR', DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.getenv('TRANSCRIBE_CACHE_MAX_BYTES', str(DEFAULT_MAX_BYTES)))
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # key -> 文件大小，按访问顺序排列
+        self._total_bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load(self):
+        """首次访问时扫描缓存目录"""
+        if self._loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-len(".json")], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._loaded = True
+        logger.info(f"转录缓存已加载: {len(self._entries)} 条, {self._total_bytes} 字节")
+
+    def get(self, key: str) -> Optional[Tuple[str, List[TimestampedText]]]:
+        """查找缓存，命中时返回 (文本, 时间戳分段)"""
+        with self._lock:
+            self._load()
+            if key not in self._entries:
+                return None
+
+            path = self._path(key)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                os.utime(path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取转录缓存失败: {e}")
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+            segments = [TimestampedText(text=text, start_time=start, end_time=end)
+                        for text, start, end in data["timestamps"]]
+            return data["text"], segments
+
+    def put(self, key: str, text: str, segments: List[TimestampedText]):
+        """写入缓存并按总大小淘汰最久未使用的条目"""
+        payload = json.dumps({
+            "text": text,
+            "timestamps": [[item.text, item.start_time, item.end_time] for item in segments]
+        }, ensure_ascii=False).encode("utf-8")
+        if len(payload) > self.max_bytes:
+            return
+
+        with self._lock:
+            self._load()
+            path = self._path(key)
+            tmp_path = f"{path}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(payload)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"写入转录缓存失败: {e}")
+                return
+
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(payload)
+            self._total_bytes += len(payload)
+
+            while self._total_bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def _remove(self, key: str):
+        self._total_bytes -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
@@ -0,0 +1,121 @@
+import os
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 优先级，数值越小越优先
+PRIORITY_LIVE = 0         # 直播字幕翻译
+PRIORITY_INTERACTIVE = 1  # 交互式 /translate/text 请求
+PRIORITY_BATCH = 2        # 批量任务
+PRIORITY_NAMES = {
+    "live": PRIORITY_LIVE,
+    "interactive": PRIORITY_INTERACTIVE,
+    "batch": PRIORITY_BATCH,
+}
+
+DEFAULT_QUEUE_LIMITS = {
+    PRIORITY_LIVE: int(os.getenv('TRANSLATION_QUEUE_LIMIT_LIVE', '200')),
+    PRIORITY_INTERACTIVE: int(os.getenv('TRANSLATION_QUEUE_LIMIT_INTERACTIVE', '100')),
+    PRIORITY_BATCH: int(os.getenv('TRANSLATION_QUEUE_LIMIT_BATCH', '500')),
+}
+DEFAULT_CLIENT_QUEUE_LIMIT = int(os.getenv('TRANSLATION_CLIENT_QUEUE_LIMIT', '20'))
+
+
+class SchedulerOverloaded(RuntimeError):
+    """翻译队列已满"""
+    pass
+
+
+class TranslationScheduler:
+    """按优先级与客户端公平调度的并发限制器
+
+    替代 FIFO 信号量：空闲名额优先分配给高优先级类别，同一类别内按客户端轮转，
+    单个客户端只能按轮次获得名额；类别或客户端的排队数超过上限时立即拒绝。
+    直播字幕以任务为客户端，一个分片的多条字幕同时排队，只受类别上限约束。
+    """
+
+    def __init__(self, max_concurrent: int = 10, queue_limits: Optional[Dict[int, int]] = None,
+                 client_queue_limit: Optional[int] = None):
+        self.max_concurrent = max_concurrent
+        self.queue_limits = queue_limits or dict(DEFAULT_QUEUE_LIMITS)
+        self.client_queue_limit = client_queue_limit or DEFAULT_CLIENT_QUEUE_LIMIT
+        self._active = 0
+        # 每个优先级一个 client_id -> 等待队列 的有序字典，按顺序轮转
+        self._queues: List["OrderedDict[str, Deque[asyncio.Future]]"] = [
+            OrderedDict() for _ in sorted(PRIORITY_NAMES.values())
+        ]
+        self._depth = [0] * len(self._queues)
+
+    @property
+    def queued(self) -> int:
+        return sum(self._depth)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE, client_id: str = "anonymous"):
+        """占用一个并发名额"""
+        await self.acquire(priority, client_id)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE, client_id: str = "anonymous"):
+        """获取并发名额，排队已满时抛出 SchedulerOverloaded"""
+        if self._active < self.max_concurrent and self.queued == 0:
+            self._active += 1
+            return
+
+        queues = self._queues[priority]
+        waiters = queues.get(client_id)
+        if self._depth[priority] >= self.queue_limits[priority]:
+            logger.warning(f"翻译队列已满，拒绝请求: 优先级 {priority}，排队数 {self._depth[priority]}")
+            raise SchedulerOverloaded(f"翻译队列已满(优先级 {priority})")
+        if priority != PRIORITY_LIVE and waiters is not None and len(waiters) >= self.client_queue_limit:
+            logger.warning(f"客户端排队请求过多，拒绝请求: {client_id}，排队数 {len(waiters)}")
+            raise SchedulerOverloaded(f"客户端 {client_id} 排队请求过多")
+
+        future = asyncio.get_running_loop().create_future()
+        if waiters is None:
+            waiters = queues[client_id] = deque()
+        waiters.append(future)
+        self._depth[priority] += 1
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 名额已经转交给本请求，取消时归还
+                self.release()
+            elif future in waiters:
+                waiters.remove(future)
+                self._depth[priority] -= 1
+                if not waiters and queues.get(client_id) is waiters:
+                    del queues[client_id]
+            raise
+
+    def release(self):
+        """归还名额，直接转交给下一个等待者"""
+        future = self._next_waiter()
+        if future is not None:
+            future.set_result(None)
+        else:
+            self._active -= 1
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        """按优先级取出下一个等待者，同一优先级内按客户端轮转"""
+        for priority, queues in enumerate(self._queues):
+            while queues:
+                client_id, waiters = next(iter(queues.items()))
+                future = waiters.popleft()
+                self._depth[priority] -= 1
+                if waiters:
+                    queues.move_to_end(client_id)
+                else:
+                    del queues[client_id]
+                if not future.done():
+                    return future
+        return None
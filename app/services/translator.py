@@ -1,16 +1,21 @@
 import httpx
 import json
+import asyncio
 import logging
 import time
 import os
-from typing import AsyncGenerator, Union
+from collections import OrderedDict
+from typing import AsyncGenerator, Dict, List, Optional, Tuple, Union
 from functools import lru_cache
-from tenacity import retry, stop_after_attempt, wait_exponential
-from asyncio import Semaphore
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
+from app.services.translation_scheduler import TranslationScheduler, SchedulerOverloaded, PRIORITY_INTERACTIVE
 from app.utils.language import LANGUAGE_MAPPING
 
 logger = logging.getLogger(__name__)
 
+# 多目标语言翻译时，原文长度 x 目标语言数不超过该值则合并为一次结构化请求，否则并发分别请求
+MULTI_TARGET_MAX_CHARS = int(os.getenv('MULTI_TARGET_MAX_CHARS', '1000'))
+
 
 class DeepSeekTranslator:
     def __init__(self, max_concurrent: int = 10):
@@ -22,7 +27,10 @@ class DeepSeekTranslator:
             raise RuntimeError("DeepSeek配置不完整，请检查环境变量")
 
         self._client = httpx.AsyncClient()
-        self._semaphore = Semaphore(max_concurrent)
+        self._scheduler = TranslationScheduler(max_concurrent)
+        # (原文, 源语言, 目标语言) -> 译文
+        self._cache: "OrderedDict[Tuple[str, str, str], str]" = OrderedDict()
+        self._cache_size = int(os.getenv('TRANSLATION_CACHE_SIZE', '1024'))
 
     @property
     def api_url(self) -> str:
@@ -53,9 +61,15 @@ class DeepSeekTranslator:
             text: str,
             source_lang: str,
             target_lang: str,
-            stream: bool = False
+            stream: bool = False,
+            priority: int = PRIORITY_INTERACTIVE,
+            client_id: str = "anonymous"
     ) -> Union[str, AsyncGenerator[str, None]]:
-        """翻译核心方法"""
+        """翻译核心方法
+        Args:
+            priority: 调度优先级
+            client_id: 用于公平排队的客户端标识
+        """
         if not self._validate_language(source_lang, target_lang):
             raise ValueError("不支持的语言代码")
 
@@ -63,9 +77,93 @@ class DeepSeekTranslator:
         data = self._build_request_data(text, source_lang, target_lang, stream)
 
         if stream:
-            return self._stream_translate(headers, data)
-        else:
-            return await self._normal_translate(headers, data)
+            return self._stream_translate(headers, data, priority, client_id)
+
+        cached = self._cache_get(text, source_lang, target_lang)
+        if cached is not None:
+            return cached
+        translated_text = await self._normal_translate(headers, data, priority, client_id)
+        self._cache_put(text, source_lang, target_lang, translated_text)
+        return translated_text
+
+    async def translate_many(self, text: str, source_lang: str, target_langs: List[str],
+                             priority: int = PRIORITY_INTERACTIVE, client_id: str = "anonymous") -> Dict[str, str]:
+        """把同一段文本翻译成多种目标语言
+
+        已缓存的目标语言直接返回；其余的在文本较短时合并为一次结构化请求，
+        否则在共享的并发限制下分别并发请求。
+        """
+        if not all(self._validate_language(source_lang, target_lang) for target_lang in target_langs):
+            raise ValueError("不支持的语言代码")
+
+        results = {}
+        missing = []
+        for target_lang in target_langs:
+            cached = self._cache_get(text, source_lang, target_lang)
+            if cached is not None:
+                results[target_lang] = cached
+            elif target_lang not in missing:
+                missing.append(target_lang)
+
+        if len(missing) > 1 and len(text) * len(missing) <= MULTI_TARGET_MAX_CHARS:
+            translated = await self._multi_translate(text, source_lang, missing, priority, client_id)
+            for target_lang, translated_text in translated.items():
+                results[target_lang] = translated_text
+                self._cache_put(text, source_lang, target_lang, translated_text)
+            missing = [target_lang for target_lang in missing if target_lang not in translated]
+
+        if missing:
+            translations = await asyncio.gather(*(
+                self.translate(text=text, source_lang=source_lang, target_lang=target_lang,
+                               priority=priority, client_id=client_id)
+                for target_lang in missing
+            ))
+            results.update(zip(missing, translations))
+
+        return {target_lang: results[target_lang] for target_lang in target_langs}
+
+    async def _multi_translate(self, text: str, source_lang: str, target_langs: List[str],
+                               priority: int, client_id: str) -> Dict[str, str]:
+        """一次结构化请求返回所有目标语言的译文，解析失败的语言由调用方单独补译"""
+        data = {
+            "model": self.model,
+            "messages": [{
+                "role": "user",
+                "content": self._build_multi_prompt(text, source_lang, tuple(target_langs))
+            }],
+            "temperature": 0.3,
+            "max_tokens": 2000,
+            "response_format": {"type": "json_object"},
+            "stream": False
+        }
+        content = await self._normal_translate(self._build_headers(), data, priority, client_id)
+        try:
+            parsed = json.loads(content)
+        except json.JSONDecodeError:
+            logger.warning(f"多语言翻译结果不是有效的JSON: {content}")
+            return {}
+        if not isinstance(parsed, dict):
+            return {}
+        return {
+            target_lang: parsed[target_lang].strip()
+            for target_lang in target_langs
+            if isinstance(parsed.get(target_lang), str)
+        }
+
+    def _cache_get(self, text: str, source_lang: str, target_lang: str) -> Optional[str]:
+        key = (text, source_lang, target_lang)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        return None
+
+    def _cache_put(self, text: str, source_lang: str, target_lang: str, translated_text: str):
+        if not translated_text:
+            return
+        self._cache[(text, source_lang, target_lang)] = translated_text
+        self._cache.move_to_end((text, source_lang, target_lang))
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
 
     def _validate_language(self, source_lang: str, target_lang: str) -> bool:
         """验证语言代码"""
@@ -95,6 +193,23 @@ class DeepSeekTranslator:
             extra="请逐句翻译并立即返回结果，不要等待全文。" if stream else "只返回翻译结果，不要添加任何解释或额外内容。"
         )
 
+    @lru_cache(maxsize=256)
+    def _build_multi_prompt(self, text: str, source_lang: str, target_langs: Tuple[str, ...]) -> str:
+        """构建多目标语言翻译提示词(带缓存)"""
+        prompt_template = """
+        你是一个专业的翻译助手，请将以下 {source} 文本分别翻译成 {targets}。
+        保持原意不变，但可以根据目标语言的表达习惯适当调整语序和用词。
+        以JSON对象返回结果，键为语言代码({codes})，值为对应的译文，不要添加任何解释或额外内容。
+
+        原文: {text}
+        """
+        return prompt_template.format(
+            source=LANGUAGE_MAPPING[source_lang],
+            targets="、".join(f"{LANGUAGE_MAPPING[lang]}({lang})" for lang in target_langs),
+            codes=", ".join(target_langs),
+            text=text
+        )
+
     def _build_request_data(self, text: str, source_lang: str, target_lang: str, stream: bool) -> dict:
         """构建请求数据"""
         return {
@@ -109,11 +224,13 @@ class DeepSeekTranslator:
         }
 
     @retry(stop=stop_after_attempt(3),
-           wait=wait_exponential(multiplier=1, min=4, max=10))
-    async def _normal_translate(self, headers: dict, data: dict) -> str:
-        """普通翻译模式(带重试机制)"""
+           wait=wait_exponential(multiplier=1, min=4, max=10),
+           retry=retry_if_not_exception_type(SchedulerOverloaded))
+    async def _normal_translate(self, headers: dict, data: dict,
+                                priority: int = PRIORITY_INTERACTIVE, client_id: str = "anonymous") -> str:
+        """普通翻译模式(带重试机制，排队已满时直接拒绝不重试)"""
         start = time.monotonic()
-        async with self._semaphore:
+        async with self._scheduler.slot(priority, client_id):
             try:
                 response = await self._client.post(
                     self.api_url,
@@ -136,9 +253,11 @@ class DeepSeekTranslator:
             finally:
                 logger.info(f"翻译耗时: {time.monotonic() - start:.2f}s")
 
-    async def _stream_translate(self, headers: dict, data: dict) -> AsyncGenerator[str, None]:
+    async def _stream_translate(self, headers: dict, data: dict,
+                                priority: int = PRIORITY_INTERACTIVE,
+                                client_id: str = "anonymous") -> AsyncGenerator[str, None]:
         """流式翻译模式"""
-        async with self._semaphore:
+        async with self._scheduler.slot(priority, client_id):
             try:
                 async with self._client.stream(
                         "POST",
@@ -168,5 +287,21 @@ class DeepSeekTranslator:
         await self._client.aclose()
 
 
-# 单例
-translator = DeepSeekTranslator()
\ No newline at end of file
+# 单例，首次使用时创建，避免启动时因缺少配置导致整个服务无法启动
+_translator: Optional[DeepSeekTranslator] = None
+
+
+def get_translator() -> DeepSeekTranslator:
+    """获取翻译器单例"""
+    global _translator
+    if _translator is None:
+        _translator = DeepSeekTranslator()
+    return _translator
+
+
+async def close_translator():
+    """释放翻译器单例"""
+    global _translator
+    if _translator is not None:
+        await _translator.close()
+        _translator = None
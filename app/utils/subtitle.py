@@ -0,0 +1,42 @@
+from typing import Iterable, Tuple
+
+# 字幕格式
+SUBTITLE_FORMATS = ("vtt", "srt")
+
+
+def format_timestamp(seconds: float, fmt: str = "vtt") -> str:
+    """格式化字幕时间戳，vtt 为 00:00:00.000，srt 为 00:00:00,000"""
+    millis = int(round(max(0.0, seconds) * 1000))
+    hours, millis = divmod(millis, 3600 * 1000)
+    minutes, millis = divmod(millis, 60 * 1000)
+    secs, millis = divmod(millis, 1000)
+    separator = "." if fmt == "vtt" else ","
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+def render_vtt(cues: Iterable[Tuple[int, float, float, str]], hls: bool = False) -> str:
+    """渲染 WebVTT，cues 为 (序号, 开始时间, 结束时间, 文本)
+    Args:
+        hls: 是否作为 HLS 字幕分片输出，需要携带 X-TIMESTAMP-MAP 头
+    """
+    lines = ["WEBVTT"]
+    if hls:
+        lines.append("X-TIMESTAMP-MAP=MPEGTS:0,LOCAL:00:00:00.000")
+    lines.append("")
+    for index, start_time, end_time, text in cues:
+        lines.append(str(index))
+        lines.append(f"{format_timestamp(start_time)} --> {format_timestamp(end_time)}")
+        lines.append(text)
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+def render_srt(cues: Iterable[Tuple[int, float, float, str]]) -> str:
+    """渲染 SRT，cues 为 (序号, 开始时间, 结束时间, 文本)"""
+    lines = []
+    for index, start_time, end_time, text in cues:
+        lines.append(str(index))
+        lines.append(f"{format_timestamp(start_time, 'srt')} --> {format_timestamp(end_time, 'srt')}")
+        lines.append(text)
+        lines.append("")
+    return "\n".join(lines) + "\n" if lines else ""
@@ -0,0 +1,59 @@
+"""启动耗时基准
+
+分别在全新的解释器中测量 FastAPI 空应用与本服务从导入到就绪的耗时，
+用于确认服务的启动时间接近 FastAPI 基线。
+
+用法: python benchmarks/bench_startup.py [-n 次数]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+BASELINE = """
+import time
+start = time.perf_counter()
+from fastapi import FastAPI
+app = FastAPI()
+app.openapi()
+print(time.perf_counter() - start)
+"""
+
+SERVICE = """
+import time
+start = time.perf_counter()
+from app.main import app
+app.openapi()
+print(time.perf_counter() - start)
+"""
+
+
+def measure(code: str, runs: int) -> list:
+    """在独立进程中多次运行代码片段，返回每次的耗时(秒)"""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    timings = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=ROOT, env=env)
+        timings.append(float(output.decode().strip().splitlines()[-1]))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量服务启动耗时")
+    parser.add_argument("-n", "--runs", type=int, default=10, help="每项测量的运行次数")
+    args = parser.parse_args()
+
+    baseline = measure(BASELINE, args.runs)
+    service = measure(SERVICE, args.runs)
+
+    for name, timings in (("FastAPI 基线", baseline), ("本服务", service)):
+        print(f"{name}: 中位数 {statistics.median(timings) * 1000:.1f}ms, "
+              f"最小 {min(timings) * 1000:.1f}ms, 最大 {max(timings) * 1000:.1f}ms")
+    print(f"差值: {(statistics.median(service) - statistics.median(baseline)) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()